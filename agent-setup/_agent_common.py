@@ -0,0 +1,165 @@
+"""
+Helpers shared by the agent creation scripts.
+
+Both create_customer_service_agent.py and create_agent_v2.py smoke-test the
+new agent, record its ID in the project root .env file and print a list of
+next steps; the implementations live here, parametrized by the .env
+variable name and the label used in output.
+"""
+
+import os
+import re
+import sys
+from contextlib import contextmanager
+from functools import lru_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locking, writes are still atomic
+    fcntl = None
+
+from _config import ENV_PATH
+
+# Banner separator
+SEP = "=" * 70
+
+# Queries sent to a newly created agent as a smoke test
+SMOKE_TEST_QUERIES = (
+    "What are your business hours?",
+)
+
+
+@lru_cache(maxsize=None)
+def _env_var_pattern(var_name):
+    """Return a compiled pattern matching the `var_name=...` line in .env."""
+    return re.compile(rf"^{re.escape(var_name)}=.*$", re.MULTILINE)
+
+
+@contextmanager
+def _env_lock():
+    """Hold an exclusive lock on .env.lock for a read-modify-write of .env."""
+    lock_path = ENV_PATH.with_name(ENV_PATH.name + ".lock")
+    with open(lock_path, "w") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def save_agent_id_to_env(agent_id, var_name, comment, label="Agent"):
+    """
+    Save an agent ID to the .env file under `var_name`.
+
+    The update runs under a file lock and replaces .env atomically, so
+    scripts creating different agents in parallel don't clobber each
+    other's entries.
+    """
+    env_file = ENV_PATH
+    entry = f"{var_name}={agent_id}"
+
+    with _env_lock():
+        # Read existing .env content
+        content = env_file.read_text(encoding="utf-8") if env_file.exists() else ""
+
+        # Update or add the variable in a single pass
+        content, updated = _env_var_pattern(var_name).subn(lambda _: entry, content, count=1)
+
+        if not updated:
+            content += f"\n# {comment}\n{entry}\n"
+
+        # Write to a temp file and swap it in
+        tmp_file = env_file.with_name(env_file.name + ".tmp")
+        tmp_file.write_text(content, encoding="utf-8")
+        os.replace(tmp_file, env_file)
+
+    print(f"\n💾 {label} ID saved to .env file:")
+    print(f"   {entry}")
+
+
+def test_agent(project_client, agent_id, label="Agent", queries=SMOKE_TEST_QUERIES):
+    """
+    Test the agent with sample queries.
+    
+    All queries share a single thread so the thread is created only once.
+    The replies are fetched newest first with one messages.list call that
+    stops once every query's messages have been seen, and are matched to
+    their query by run ID rather than by position.
+    """
+
+    try:
+        # Create a thread
+        thread = project_client.agents.threads.create()
+        run_ids = []
+
+        for query in queries:
+            # Send a test message
+            project_client.agents.messages.create(
+                thread_id=thread.id,
+                role="user",
+                content=query
+            )
+
+            # Run the agent
+            run = project_client.agents.runs.create_and_process(
+                thread_id=thread.id,
+                agent_id=agent_id
+            )
+
+            # The processed run already carries its final status, so a failed
+            # run can be reported without fetching the thread's messages
+            if run.status == "failed":
+                print(f"   User: {query}")
+                print(f"⚠️  {label} test failed: {run.last_error}")
+                return
+            run_ids.append(run.id)
+
+        # Get the replies, newest first; each query adds one user message,
+        # so the listing can stop at the first query's message
+        messages = project_client.agents.messages.list(
+            thread_id=thread.id,
+            order="desc",
+            limit=min(100, 2 * len(queries))
+        )
+        replies = {run_id: [] for run_id in run_ids}
+        user_messages = 0
+        for msg in messages:
+            if msg.role == "user":
+                user_messages += 1
+                if user_messages == len(queries):
+                    break
+            elif msg.run_id in replies:
+                replies[msg.run_id].append("".join(
+                    content.text.value for content in msg.content
+                    if hasattr(content, 'text') and hasattr(content.text, 'value')
+                ))
+
+        for query, run_id in zip(queries, run_ids):
+            print(f"   User: {query}")
+            # Messages of a run were collected newest first
+            response_text = "\n".join(reversed(replies[run_id]))
+            if not response_text:
+                print(f"⚠️  {label} test failed: no reply to this query")
+                return
+            print(f"   {label}: {response_text}\n")
+
+        print(f"✅ {label} test successful!")
+
+    except Exception as e:
+        print(f"⚠️  {label} test failed: {str(e)}")
+
+
+def display_next_steps(steps):
+    """
+    Display numbered next steps for the user.
+
+    Args:
+        steps: Sequence of (title, lines) pairs, one per step.
+    """
+    body = "".join(
+        f"\n{number}. {title}\n" + "".join(f"   {line}\n" for line in lines)
+        for number, (title, lines) in enumerate(steps, 1)
+    )
+    sys.stdout.write(f"\n{SEP}\n🎯 Next Steps\n{SEP}\n{body}\n{SEP}\n\n")
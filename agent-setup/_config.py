@@ -0,0 +1,58 @@
+"""
+Shared configuration for the agent-setup scripts.
+
+Loads the project-root .env file once per process and exposes the settings
+used by the agent creation scripts as module constants, so importing several
+scripts together does not re-parse the .env file. The Azure credential and
+project client are likewise created once and shared; the credential comes
+from scripts/_credential.py, so these scripts and the evaluation scripts
+authenticate the same way, and the client uses the same pooled transport
+(scripts/_http.py).
+"""
+
+import os
+from functools import cache, lru_cache
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# The credential policy and HTTP transport are shared with the evaluation
+# scripts; the project root is on sys.path for every agent-setup entry point
+from scripts._credential import get_credential, in_ci
+from scripts._http import pooled_transport
+
+# Project root .env file
+ENV_PATH = Path(__file__).parent.parent / '.env'
+
+
+@cache
+def _load_env(path):
+    """Load environment variables from a .env file, once per path."""
+    load_dotenv(path)
+
+
+_load_env(str(ENV_PATH))
+
+_env = os.environ
+
+# Configuration
+PROJECT_ENDPOINT = _env.get("AZURE_AI_PROJECT_ENDPOINT")
+MODEL_DEPLOYMENT = _env.get("AZURE_DEPLOYMENT_NAME", "gpt-4o")
+
+# Print full tracebacks on errors when set
+AGENT_DEBUG = bool(_env.get("AGENT_DEBUG"))
+
+# Running under CI (GitHub Actions sets CI=true)
+IN_CI = in_ci()
+
+
+@lru_cache(maxsize=1)
+def get_client():
+    """Return the process-wide AIProjectClient for PROJECT_ENDPOINT."""
+    from azure.ai.projects import AIProjectClient
+
+    return AIProjectClient(
+        endpoint=PROJECT_ENDPOINT,
+        credential=get_credential(),
+        transport=pooled_transport()
+    )
@@ -0,0 +1,74 @@
+"""
+Shared Azure credential for the evaluation and agent-setup scripts.
+
+Every script creates its credential through get_credential(), so the project
+client, red team scanner and evaluators in a process share one instance, and
+the evaluation scripts and agent-setup/_config.py follow the same credential
+policy. Service principal tokens (EnvironmentCredential) can additionally be
+kept in a persistent MSAL token cache, so later runs reuse them instead of
+going back to Microsoft Entra ID; see AZURE_TOKEN_CACHE.
+"""
+
+import os
+from functools import lru_cache
+
+# Name of the persistent MSAL token cache
+TOKEN_CACHE_NAME = "foundry-eval"
+
+# Accepted AZURE_TOKEN_CACHE values: no persistent cache (default), a cache
+# encrypted with the OS keyring, or one that may fall back to plain text where
+# no keyring is available
+TOKEN_CACHE_MODES = ("off", "encrypted", "unencrypted")
+
+
+def in_ci():
+    """Whether the process runs under CI (GitHub Actions sets CI=true)."""
+    return os.getenv("CI", "").lower() in ("1", "true", "yes")
+
+
+@lru_cache(maxsize=1)
+def get_credential():
+    """Return the process-wide Azure credential.
+
+    Environment (service principal) credentials are tried first. In CI
+    (``CI`` set, as on GitHub Actions) they fall back only to the Azure CLI
+    session created by ``azure/login``; locally to DefaultAzureCredential
+    without the interactive browser and VS Code probes, which only add
+    latency to token acquisition.
+
+    The environment variables are read on the first call, after the scripts
+    have loaded their .env file.
+    """
+    from azure.identity import (
+        AzureCliCredential,
+        ChainedTokenCredential,
+        DefaultAzureCredential,
+        EnvironmentCredential,
+        TokenCachePersistenceOptions,
+    )
+
+    token_cache = os.getenv("AZURE_TOKEN_CACHE", "off").lower()
+    if token_cache not in TOKEN_CACHE_MODES:
+        raise ValueError(
+            f"Invalid AZURE_TOKEN_CACHE '{token_cache}'; expected one of: {', '.join(TOKEN_CACHE_MODES)}"
+        )
+
+    environment_options = {}
+    if token_cache != "off":
+        environment_options["cache_persistence_options"] = TokenCachePersistenceOptions(
+            name=TOKEN_CACHE_NAME,
+            allow_unencrypted_storage=token_cache == "unencrypted",
+        )
+    environment = EnvironmentCredential(**environment_options)
+
+    if in_ci():
+        return ChainedTokenCredential(environment, AzureCliCredential())
+
+    return ChainedTokenCredential(
+        environment,
+        DefaultAzureCredential(
+            exclude_environment_credential=True,
+            exclude_interactive_browser_credential=True,
+            exclude_visual_studio_code_credential=True,
+        ),
+    )
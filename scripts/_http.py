@@ -0,0 +1,40 @@
+"""
+Shared HTTP transport for the Azure SDK clients of the evaluation and
+agent-setup scripts.
+
+The scripts run agent queries concurrently; a pooled transport keeps enough
+keep-alive connections open that those calls reuse TLS sessions instead of
+opening a new connection each.
+"""
+
+import os
+
+# Keep-alive connections held per host unless HTTP_POOL_SIZE is set
+DEFAULT_HTTP_POOL_SIZE = 32
+
+
+def pooled_transport():
+    """Return a requests transport with HTTP_POOL_SIZE keep-alive connections.
+
+    The default transport keeps 10 connections per host; concurrent callers
+    beyond that open fresh TLS connections that are thrown away afterwards.
+    HTTP_POOL_SIZE is read on each call, after the scripts have loaded .env.
+    """
+    from azure.core.pipeline.transport import RequestsTransport
+    from requests import Session
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    pool_size = int(os.getenv("HTTP_POOL_SIZE", DEFAULT_HTTP_POOL_SIZE))
+
+    # Retries and redirects stay with the Azure pipeline policies
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=False, redirect=False, raise_on_redirect=False),
+    )
+    session = Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return RequestsTransport(session=session, session_owner=True)
@@ -0,0 +1,36 @@
+"""
+Operational metrics recorded for each agent run by the evaluation scripts.
+
+The quality and safety evaluations both attach these metrics to their
+evaluation records; building them here keeps the two scripts reporting the
+same fields with the same handling of incomplete runs.
+"""
+
+# Metrics measured from the agent run itself (as opposed to the test data)
+RUN_METRIC_KEYS = (
+    "server-run-duration-in-seconds",
+    "client-run-duration-in-seconds",
+    "completion-tokens",
+    "prompt-tokens",
+)
+
+
+def operational_metrics(run, client_duration, ground_truth):
+    """Return the operational metrics of a processed agent run.
+
+    Runs that did not complete may lack completed_at or usage; their server
+    duration and token counts are recorded as None (left out of the means
+    evaluate() reports) rather than failing the query.
+    """
+    server_duration = None
+    if run.completed_at and run.created_at:
+        server_duration = (run.completed_at - run.created_at).total_seconds()
+
+    usage = run.usage
+    return {
+        "server-run-duration-in-seconds": server_duration,
+        "client-run-duration-in-seconds": client_duration,
+        "completion-tokens": usage.completion_tokens if usage else None,
+        "prompt-tokens": usage.prompt_tokens if usage else None,
+        "ground-truth": ground_truth
+    }
@@ -15,13 +15,25 @@ Requirements:
 """
 
 import os
+import sys
 import time
 import json
+import math
+import asyncio
+import hashlib
+import sqlite3
+from functools import cache
 from pathlib import Path
 from dotenv import load_dotenv
 from urllib.parse import urlparse
 
-from azure.ai.agents.models import RunStatus, MessageRole
+from azure.ai.agents.models import (
+    AgentThreadCreationOptions,
+    MessageRole,
+    RunStatus,
+    ThreadMessageOptions,
+)
+from azure.core.exceptions import ResourceNotFoundError
 from azure.ai.projects import AIProjectClient
 from azure.ai.evaluation import (
     AIAgentConverter,
@@ -35,7 +47,10 @@ from azure.ai.evaluation import (
     FluencyEvaluator,
     SimilarityEvaluator,
 )
-from azure.identity import DefaultAzureCredential
+
+from _credential import get_credential
+from _http import pooled_transport
+from _run_metrics import RUN_METRIC_KEYS, operational_metrics as run_operational_metrics
 
 # Load environment variables
 load_dotenv()
@@ -46,12 +61,76 @@ AZURE_DEPLOYMENT_NAME = os.getenv("AZURE_DEPLOYMENT_NAME")
 AGENT_ID = os.getenv("AGENT_ID_BASELINE")
 AGENT_NAME = os.getenv("AZURE_AI_AGENT_NAME")
 
+# Test queries run against the agent at once
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "8"))
+
+# Deployment quota used to pace agent runs below the rate limit (0 = no limit)
+AZURE_RPM = int(os.getenv("AZURE_RPM", "0"))
+AZURE_TPM = int(os.getenv("AZURE_TPM", "0"))
+
+# Tokens budgeted per agent run on top of the query itself
+AGENT_RUN_TOKEN_ESTIMATE = 512
+
+# Rows scored in parallel by evaluate() (judge calls are latency-bound)
+EVAL_MAX_WORKERS = int(os.getenv("EVAL_MAX_WORKERS", "16"))
+
 # Paths
 DATA_PATH = Path(__file__).parent.parent / "data" / "agent-eval-data.json"
 OUTPUT_PATH = Path(__file__).parent.parent / "evaluation_results" / "quality_eval_output"
 EVAL_INPUT_PATH = OUTPUT_PATH / "quality-eval-input.jsonl"
 EVAL_OUTPUT_PATH = OUTPUT_PATH / "quality-eval-output.json"
 
+# Agent responses from earlier runs, reused when only evaluators change.
+# EVAL_CACHE_MODE: enabled (read + write), readonly, writeonly,
+# replay (read only, fail on a miss) or disabled
+CACHE_PATH = Path(__file__).parent.parent / "evaluation_results" / "cache" / "agent_responses.db"
+EVAL_CACHE_MODE = os.getenv("EVAL_CACHE_MODE", "enabled")
+CACHE_MODES = ("enabled", "readonly", "writeonly", "replay", "disabled")
+
+# Cache keys looked up per SQLite query
+CACHE_LOOKUP_BATCH = 500
+
+# Agent name -> ID lookups, so AZURE_AI_AGENT_NAME doesn't page through
+# every agent in the project on each run
+AGENT_IDS_CACHE_PATH = CACHE_PATH.parent / "agent_ids.json"
+AGENT_IDS_CACHE_TTL = 24 * 60 * 60
+
+# Inputs larger than EVAL_CHUNK_SIZE rows are evaluated in shards of that
+# size; finished shards are checkpointed here. With EVAL_RESUME set, a rerun
+# after a failure reuses the shards that completed instead of re-scoring them
+EVAL_CHUNK_SIZE = int(os.getenv("EVAL_CHUNK_SIZE", "64"))
+SHARDS_PATH = CACHE_PATH.parent / "quality_shards"
+EVAL_RESUME = os.getenv("EVAL_RESUME", "").lower() in ("1", "true", "yes")
+
+# Model-based quality evaluators (work in all regions), by result name
+QUALITY_EVALUATORS = {
+    "tool_call_accuracy": ToolCallAccuracyEvaluator,
+    "intent_resolution": IntentResolutionEvaluator,
+    "task_adherence": TaskAdherenceEvaluator,
+    "groundedness": GroundednessEvaluator,
+    "relevance": RelevanceEvaluator,
+    "coherence": CoherenceEvaluator,
+    "fluency": FluencyEvaluator,
+    # Compares with ground truth if provided
+    "similarity": SimilarityEvaluator,
+}
+
+# Column mapping shared by the conversation-based evaluators
+CONVERSATION_COLUMN_MAPPING = {"conversation": "${data.conversation}"}
+
+# evaluate() config: all model-based evaluators use conversation format;
+# similarity also compares against the ground truth
+EVALUATOR_COLUMN_MAPPING = {
+    name: {"column_mapping": CONVERSATION_COLUMN_MAPPING}
+    for name in QUALITY_EVALUATORS
+}
+EVALUATOR_COLUMN_MAPPING["similarity"] = {
+    "column_mapping": {
+        **CONVERSATION_COLUMN_MAPPING,
+        "ground_truth": "${data.ground_truth}"
+    }
+}
+
 
 def validate_environment():
     """Validate required environment variables are set."""
@@ -74,6 +153,10 @@ def validate_environment():
         print("\nPlease update your .env file with the required values.")
         return False
     
+    if EVAL_CACHE_MODE not in CACHE_MODES:
+        print(f"❌ Error: EVAL_CACHE_MODE must be one of: {', '.join(CACHE_MODES)}")
+        return False
+    
     return True
 
 
@@ -88,9 +171,13 @@ def load_test_data():
     with open(DATA_PATH, 'r') as f:
         data = json.load(f)
     
-    # Extract queries from the data structure
+    # Extract queries from the data structure, rejecting rows without a query
+    # before any agent runs or judge calls are spent on the file
     queries = []
-    for item in data.get('data', []):
+    for idx, item in enumerate(data.get('data', []), 1):
+        if not isinstance(item, dict) or not item.get("query"):
+            print(f"❌ Error: Test data row {idx} has no 'query' field")
+            return None
         queries.append({
             "query": item["query"],
             "ground-truth": item.get("ground-truth", "")
@@ -100,6 +187,328 @@ def load_test_data():
     return queries
 
 
+def eval_row_error(line):
+    """Return why an evaluation input line can't be scored, or None if it can."""
+    try:
+        row = json.loads(line)
+    except json.JSONDecodeError as e:
+        return f"is not valid JSON: {e}"
+    
+    messages = row.get("conversation", {}).get("messages")
+    if not messages:
+        return "has no conversation messages"
+    if not any(msg.get("role") == "assistant" for msg in messages):
+        return "has no agent response"
+    return None
+
+
+def validate_eval_input(path):
+    """
+    Check every row of the evaluation input JSONL before calling evaluate().
+
+    evaluate() bills judge calls row by row, so rows that can't be scored
+    (e.g. an agent run that failed or was filtered and left no response)
+    are reported and removed from the file, and the rest are still
+    evaluated. Returns the 1-based numbers of the removed rows.
+    """
+    lines = path.read_text(encoding="utf-8").splitlines(keepends=True)
+    kept = []
+    dropped = []
+    for idx, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        error = eval_row_error(line)
+        if error:
+            print(f"⚠️  Warning: Evaluation input row {idx} {error}; skipping it")
+            dropped.append(idx)
+        else:
+            kept.append(line)
+    
+    if dropped:
+        path.write_text("".join(kept), encoding="utf-8")
+    return dropped
+
+
+class TokenBucket:
+    """
+    Client-side limiter that paces requests below a requests-per-minute and
+    tokens-per-minute quota, so calls wait locally instead of drawing 429s
+    and retry backoff. A limit of 0 disables that dimension.
+    """
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+    
+    async def acquire(self, est_tokens):
+        """Wait until one request of about `est_tokens` tokens fits the quota."""
+        est_tokens = min(est_tokens, self.tpm)
+        while True:
+            # Work out the wait under the lock, but sleep without it so other
+            # callers can still take capacity that is already available
+            async with self._lock:
+                self._refill()
+                waits = []
+                if self.rpm and self._requests < 1:
+                    waits.append((1 - self._requests) * 60 / self.rpm)
+                if self.tpm and self._tokens < est_tokens:
+                    waits.append((est_tokens - self._tokens) * 60 / self.tpm)
+                if not waits:
+                    self._requests -= 1
+                    self._tokens -= est_tokens
+                    return
+            await asyncio.sleep(max(waits))
+
+
+@cache
+def get_evaluators(model_config_items):
+    """
+    Build the evaluators for a judge model configuration, once per process.
+    
+    `model_config_items` is the model config as a sorted tuple of items so
+    it can key the cache; construction loads each judge's prompt template.
+    """
+    model_config = dict(model_config_items)
+    return {
+        # Operational metrics
+        "operational_metrics": OperationalMetricsEvaluator(),
+        **{
+            name: evaluator(model_config=model_config)
+            for name, evaluator in QUALITY_EVALUATORS.items()
+        },
+    }
+
+
+class ResponseCache:
+    """SQLite store of evaluation records produced by earlier agent runs."""
+    def __init__(self, path, mode):
+        self.reads = mode in ("enabled", "readonly", "replay")
+        self.writes = mode in ("enabled", "writeonly")
+        self._conn = None
+        
+        if self.reads or self.writes:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, eval_item_json TEXT, created_at REAL)"
+            )
+    
+    def get_many(self, keys):
+        """Return {key: eval_item} for the keys found in the cache."""
+        if not self.reads:
+            return {}
+        keys = list(keys)
+        found = {}
+        # Older SQLite builds allow at most 999 bound parameters per query
+        for start in range(0, len(keys), CACHE_LOOKUP_BATCH):
+            batch = keys[start:start + CACHE_LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT key, eval_item_json FROM responses WHERE key IN ({placeholders})",
+                batch
+            )
+            found.update((key, json.loads(item_json)) for key, item_json in rows)
+        return found
+    
+    def put_many(self, items):
+        """Store {key: eval_item} records."""
+        if not self.writes or not items:
+            return
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                [(key, json.dumps(item), now) for key, item in items.items()]
+            )
+    
+    def close(self):
+        if self._conn:
+            self._conn.close()
+
+
+def response_cache_key(query, agent):
+    """
+    Cache key for a test query against the agent's current configuration.
+    
+    Covers every setting that changes the agent's responses, so an agent
+    updated in place (new sampling parameters or tools) misses the cache.
+    """
+    config = {
+        "id": agent.id,
+        "model": agent.model,
+        "instructions": agent.instructions,
+        "temperature": agent.temperature,
+        "top_p": agent.top_p,
+        "tools": [tool.as_dict() for tool in agent.tools or []],
+    }
+    material = f"{query}|{json.dumps(config, sort_keys=True, default=str)}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def resolve_agent_id(ai_project, name, refresh=False):
+    """
+    Look up an agent ID by name.
+    
+    Resolved IDs are cached on disk per project for AGENT_IDS_CACHE_TTL
+    seconds; `refresh` skips the cache and rescans the project's agents.
+    Returns None if no agent has that name.
+    """
+    cache_key = f"{AZURE_AI_PROJECT_ENDPOINT}#{name}"
+    try:
+        agent_ids = json.loads(AGENT_IDS_CACHE_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        agent_ids = {}
+    
+    entry = agent_ids.get(cache_key)
+    if entry and not refresh and time.time() - entry["resolved_at"] < AGENT_IDS_CACHE_TTL:
+        return entry["id"]
+    
+    agent_id = next(
+        (agent.id for agent in ai_project.agents.list_agents() if agent.name == name),
+        None
+    )
+    
+    if agent_id:
+        agent_ids[cache_key] = {"id": agent_id, "resolved_at": time.time()}
+    else:
+        agent_ids.pop(cache_key, None)
+    AGENT_IDS_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    AGENT_IDS_CACHE_PATH.write_text(json.dumps(agent_ids, indent=2), encoding="utf-8")
+    
+    return agent_id
+
+
+def evaluation_fingerprint(evaluators, evaluator_config, model_config):
+    """
+    Digest of everything besides the input rows that decides evaluate() scores.
+    
+    Covers the evaluator names and classes, their column mapping and the
+    judge model configuration.
+    """
+    material = json.dumps({
+        "evaluators": {name: type(evaluator).__name__ for name, evaluator in evaluators.items()},
+        "evaluator_config": evaluator_config,
+        "model_config": model_config,
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def shard_eval_input(path, size, fingerprint):
+    """
+    Split the evaluation input JSONL into shards of at most `size` rows.
+    
+    Returns (input_path, output_path, row_count) per shard. Files are named
+    after a digest of the evaluation `fingerprint` and the shard's rows, so
+    a resumed run over the same rows with the same evaluators finds the
+    outputs of shards that already completed, while any other configuration
+    re-scores them. Shard files from earlier inputs or configurations are
+    deleted.
+    """
+    SHARDS_PATH.mkdir(parents=True, exist_ok=True)
+    lines = [line for line in path.read_bytes().splitlines(keepends=True) if line.strip()]
+    
+    shards = []
+    for start in range(0, len(lines), size):
+        chunk = lines[start:start + size]
+        content = b"".join(chunk)
+        digest = hashlib.sha256(fingerprint.encode("ascii") + content).hexdigest()[:16]
+        shard_input = SHARDS_PATH / f"quality-eval-input-{digest}.jsonl"
+        if not shard_input.exists():
+            shard_input.write_bytes(content)
+        shards.append((shard_input, SHARDS_PATH / f"quality-eval-output-{digest}.json", len(chunk)))
+    
+    # Only the current shards can ever be reused
+    current = {path for shard_input, shard_output, _ in shards for path in (shard_input, shard_output)}
+    for stale in SHARDS_PATH.glob("quality-eval-*"):
+        if stale not in current:
+            stale.unlink()
+    
+    return shards
+
+
+def merge_eval_results(shard_results):
+    """
+    Combine per-shard evaluate() results into one result.
+    
+    Rows are concatenated in order and each metric is the mean of the shard
+    values weighted by shard row count. Shards with a NaN value for a metric
+    (no row could be scored) are left out of that metric's mean. studio_url
+    holds the first shard's portal run, as for a single evaluate() run, and
+    studio_urls lists every shard's.
+    """
+    studio_urls = [result["studio_url"] for _, result in shard_results if result.get("studio_url")]
+    totals = {}
+    weights = {}
+    for row_count, result in shard_results:
+        for key, value in result.get("metrics", {}).items():
+            if isinstance(value, (int, float)) and not math.isnan(value):
+                totals[key] = totals.get(key, 0) + value * row_count
+                weights[key] = weights.get(key, 0) + row_count
+    
+    return {
+        "rows": [row for _, result in shard_results for row in result.get("rows", [])],
+        "metrics": {key: totals[key] / weights[key] for key in totals},
+        "studio_url": studio_urls[0] if studio_urls else None,
+        "studio_urls": studio_urls,
+    }
+
+
+def evaluate_in_shards(evaluation_name, model_config, **evaluate_kwargs):
+    """
+    Run evaluate() shard by shard.
+    
+    Every shard is scored afresh unless EVAL_RESUME is set, in which case
+    shards already completed with the same rows, evaluators, column mapping
+    and judge `model_config` are reused. The merged result is written to EVAL_OUTPUT_PATH, like a single
+    evaluate() run would be.
+    """
+    fingerprint = evaluation_fingerprint(
+        evaluate_kwargs["evaluators"], evaluate_kwargs["evaluator_config"], model_config
+    )
+    shards = shard_eval_input(EVAL_INPUT_PATH, EVAL_CHUNK_SIZE, fingerprint)
+    shard_results = []
+    reused = 0
+    
+    for idx, (shard_input, shard_output, row_count) in enumerate(shards, 1):
+        if EVAL_RESUME and shard_output.exists():
+            print(f"   [{idx}/{len(shards)}] Reusing completed shard ({row_count} rows)")
+            result = json.loads(shard_output.read_text(encoding="utf-8"))
+            reused += 1
+        else:
+            # Drop any output left by an earlier run so a shard that fails
+            # now can't be mistaken for a completed one on resume
+            shard_output.unlink(missing_ok=True)
+            print(f"   [{idx}/{len(shards)}] Evaluating shard ({row_count} rows)...")
+            result = evaluate(
+                evaluation_name=f"{evaluation_name}-{idx}",
+                data=str(shard_input),
+                output_path=str(shard_output),
+                **evaluate_kwargs
+            )
+        shard_results.append((row_count, result))
+    
+    if reused:
+        print(f"♻️  Reused {reused} of {len(shards)} completed shards from {SHARDS_PATH} (EVAL_RESUME)")
+    
+    results = merge_eval_results(shard_results)
+    with open(EVAL_OUTPUT_PATH, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    
+    return results
+
+
 class OperationalMetricsEvaluator:
     """Propagate operational metrics to the final evaluation results"""
     def __init__(self):
@@ -109,6 +518,108 @@ class OperationalMetricsEvaluator:
         return metrics
 
 
+def run_query(ai_project, agent, thread_data_converter, row, idx, total):
+    """Run one test query against the agent and return its evaluation record."""
+    query = row.get("query", "")
+    query_preview = f"{query[:60]}..." if len(query) > 60 else query
+    print(f"   [{idx}/{total}] Testing: {query_preview}")
+    
+    # Create a new thread seeded with the user query and run the agent on it
+    # in one call; each query gets its own thread to isolate conversations
+    start_time = time.perf_counter()
+    run = ai_project.agents.create_thread_and_process_run(
+        agent_id=agent.id,
+        thread=AgentThreadCreationOptions(
+            messages=[ThreadMessageOptions(role=MessageRole.USER, content=query)]
+        )
+    )
+    client_duration = time.perf_counter() - start_time
+    
+    if run.status != RunStatus.COMPLETED:
+        print(f"   ⚠️ Warning: [{idx}/{total}] Run status: {run.status}")
+        if run.last_error:
+            print(f"   Error: {run.last_error}")
+    
+    # Calculate operational metrics
+    operational_metrics = run_operational_metrics(run, client_duration, row.get("ground-truth", ''))
+    
+    # Use AIAgentConverter to prepare evaluation data (matches golden template!)
+    evaluation_data = thread_data_converter.prepare_evaluation_data(thread_ids=run.thread_id)
+    eval_item = evaluation_data[0]
+    
+    # Transform query + response into conversation format for evaluators
+    # AIAgentConverter produces separate 'query' and 'response' arrays
+    # But evaluators expect a single 'conversation' array with all messages
+    query_messages = eval_item.get("query", [])
+    response_messages = eval_item.get("response", [])
+    
+    # Combine into conversation format
+    conversation_messages = query_messages + response_messages
+    
+    # Create evaluation record with conversation format
+    return {
+        "conversation": {"messages": conversation_messages},
+        "metrics": operational_metrics,
+        "ground_truth": row.get("ground-truth", "")
+    }
+
+
+async def run_queries(ai_project, agent, thread_data_converter, test_data):
+    """
+    Run all test queries, at most EVAL_CONCURRENCY at a time.
+    
+    The agent runs are network-bound, so they overlap in worker threads.
+    Yields the evaluation records in test data order, each as soon as it
+    and every record before it are ready.
+    """
+    semaphore = asyncio.Semaphore(EVAL_CONCURRENCY)
+    bucket = TokenBucket(AZURE_RPM, AZURE_TPM) if AZURE_RPM or AZURE_TPM else None
+    total = len(test_data)
+    
+    async def run_bounded(idx, row):
+        async with semaphore:
+            if bucket:
+                await bucket.acquire(len(row["query"]) // 4 + AGENT_RUN_TOKEN_ESTIMATE)
+            return await asyncio.to_thread(
+                run_query, ai_project, agent, thread_data_converter, row, idx, total
+            )
+    
+    tasks = [
+        asyncio.create_task(run_bounded(idx, row))
+        for idx, row in enumerate(test_data, 1)
+    ]
+    for task in tasks:
+        yield await task
+
+
+async def write_eval_input(path, test_data, keys, cached, fresh):
+    """
+    Write one evaluation record per test row to the JSONL file at `path`.
+    
+    Cached records are used where available and the rest are taken, in
+    order, from `fresh`, the async iterator of new agent runs. Each line is
+    written as soon as its record is ready rather than after all runs
+    finish. Returns the new records by cache key.
+    
+    Cached records have their run latency and token counts blanked: they
+    describe an earlier run, not this one.
+    """
+    new_items = {}
+    with open(path, "w", encoding="utf-8") as f:
+        for row, key in zip(test_data, keys):
+            if key in cached:
+                # Ground truth comes from the current test data, not the cache
+                eval_item = cached[key]
+                eval_item["ground_truth"] = row.get("ground-truth", "")
+                eval_item["metrics"]["ground-truth"] = row.get("ground-truth", "")
+                eval_item["metrics"].update(dict.fromkeys(RUN_METRIC_KEYS))
+            else:
+                eval_item = new_items[key] = await anext(fresh)
+            f.write(json.dumps(eval_item) + "\n")
+    
+    return new_items
+
+
 def run_evaluation():
     """Run the agent quality evaluation using AIAgentConverter (golden template approach)."""
     print("\n" + "="*80)
@@ -132,11 +643,12 @@ def run_evaluation():
     print("🔗 Connecting to Azure AI Project...")
     print(f"   Endpoint: {AZURE_AI_PROJECT_ENDPOINT}")
     
-    credential = DefaultAzureCredential()
+    credential = get_credential()
     ai_project = AIProjectClient(
         credential=credential,
         endpoint=AZURE_AI_PROJECT_ENDPOINT,
-        api_version="2025-05-15-preview"  # Required for evaluations (from golden template)
+        api_version="2025-05-15-preview",  # Required for evaluations (from golden template)
+        transport=pooled_transport()
     )
     
     print("✅ Connected to Azure AI Project")
@@ -145,10 +657,7 @@ def run_evaluation():
     agent_id = AGENT_ID
     if not agent_id and AGENT_NAME:
         print(f"\n🔍 Looking up agent by name: {AGENT_NAME}")
-        for agent in ai_project.agents.list_agents():
-            if agent.name == AGENT_NAME:
-                agent_id = agent.id
-                break
+        agent_id = resolve_agent_id(ai_project, AGENT_NAME)
         
         if not agent_id:
             print(f"❌ Error: Agent '{AGENT_NAME}' not found")
@@ -156,7 +665,18 @@ def run_evaluation():
     
     # Get agent details
     print(f"\n🤖 Loading agent: {agent_id}")
-    agent = ai_project.agents.get_agent(agent_id)
+    try:
+        agent = ai_project.agents.get_agent(agent_id)
+    except ResourceNotFoundError:
+        if AGENT_ID:
+            raise
+        # The cached ID is stale (agent deleted or recreated); look it up again
+        agent_id = resolve_agent_id(ai_project, AGENT_NAME, refresh=True)
+        if not agent_id:
+            print(f"❌ Error: Agent '{AGENT_NAME}' not found")
+            return None
+        print(f"   Cached ID was stale, loading agent: {agent_id}")
+        agent = ai_project.agents.get_agent(agent_id)
     
     # Use deployment from agent if not provided
     deployment_name = AZURE_DEPLOYMENT_NAME or agent.model
@@ -180,119 +700,76 @@ def run_evaluation():
     # Create output directory
     OUTPUT_PATH.mkdir(parents=True, exist_ok=True)
     
-    print(f"\n📝 Running {len(test_data)} test queries...")
-    
-    # Execute test queries against the agent
-    with open(EVAL_INPUT_PATH, "w", encoding="utf-8") as f:
-        for idx, row in enumerate(test_data, 1):
-            query_preview = row.get('query', '')[:60]
-            if len(row.get('query', '')) > 60:
-                query_preview += "..."
-            print(f"   [{idx}/{len(test_data)}] Testing: {query_preview}")
-            
-            # Create a new thread for each query to isolate conversations
-            thread = ai_project.agents.threads.create()
-            
-            # Create the user query
-            ai_project.agents.messages.create(
-                thread.id,
-                role=MessageRole.USER,
-                content=row.get("query")
-            )
-            
-            # Run agent on thread and measure performance
-            start_time = time.time()
-            run = ai_project.agents.runs.create_and_process(
-                thread_id=thread.id,
-                agent_id=agent.id
-            )
-            end_time = time.time()
-            
-            if run.status != RunStatus.COMPLETED:
-                print(f"   ⚠️ Warning: Run status: {run.status}")
-                if run.last_error:
-                    print(f"   Error: {run.last_error}")
-            
-            # Calculate operational metrics
-            operational_metrics = {
-                "server-run-duration-in-seconds": (
-                    run.completed_at - run.created_at
-                ).total_seconds(),
-                "client-run-duration-in-seconds": end_time - start_time,
-                "completion-tokens": run.usage.completion_tokens,
-                "prompt-tokens": run.usage.prompt_tokens,
-                "ground-truth": row.get("ground-truth", '')
-            }
-            
-            # Use AIAgentConverter to prepare evaluation data (matches golden template!)
-            evaluation_data = thread_data_converter.prepare_evaluation_data(thread_ids=thread.id)
-            eval_item = evaluation_data[0]
-            
-            # Transform query + response into conversation format for evaluators
-            # AIAgentConverter produces separate 'query' and 'response' arrays
-            # But evaluators expect a single 'conversation' array with all messages
-            query_messages = eval_item.get("query", [])
-            response_messages = eval_item.get("response", [])
-            
-            # Combine into conversation format
-            conversation_messages = query_messages + response_messages
-            
-            # Create evaluation record with conversation format
-            eval_item = {
-                "conversation": {"messages": conversation_messages},
-                "metrics": operational_metrics,
-                "ground_truth": row.get("ground-truth", "")
-            }
-            
-            f.write(json.dumps(eval_item) + "\n")
+    # Reuse agent responses recorded by earlier runs where the cache mode allows
+    cache = ResponseCache(CACHE_PATH, EVAL_CACHE_MODE)
+    keys = [response_cache_key(row["query"], agent) for row in test_data]
+    cached = cache.get_many(keys)
+    pending = [row for row, key in zip(test_data, keys) if key not in cached]
+    if cache.reads:
+        print(f"\n🗄️  {len(test_data) - len(pending)} cached agent response(s) reused from {CACHE_PATH}")
+        if cached:
+            print("   Latency and token metrics cover only the queries run now")
+    
+    if pending and EVAL_CACHE_MODE == "replay":
+        cache.close()
+        raise RuntimeError(
+            f"{len(pending)} test queries have no cached response (EVAL_CACHE_MODE=replay)"
+        )
+    
+    print(f"\n📝 Running {len(pending)} test queries (up to {EVAL_CONCURRENCY} at a time)...")
+    
+    # Execute the remaining test queries against the agent concurrently,
+    # streaming the evaluation input to disk in test data order
+    new_items = asyncio.run(write_eval_input(
+        EVAL_INPUT_PATH, test_data, keys, cached,
+        run_queries(ai_project, agent, thread_data_converter, pending)
+    ))
     
     print(f"\n✅ Test queries completed!")
     print(f"   Evaluation input saved to: {EVAL_INPUT_PATH}")
     
+    # Drop rows that can't be scored before any judge calls are made; only
+    # new responses that passed are cached, so a bad record is never
+    # replayed by later runs. The input has one line per test row, in order.
+    try:
+        dropped = validate_eval_input(EVAL_INPUT_PATH)
+        dropped_keys = {keys[idx - 1] for idx in dropped}
+        cache.put_many({key: item for key, item in new_items.items() if key not in dropped_keys})
+    finally:
+        cache.close()
+    
+    if len(dropped) == len(test_data):
+        print("❌ Error: No evaluation input row can be scored")
+        return None
+    if dropped:
+        print(f"   Evaluating the remaining {len(test_data) - len(dropped)} of {len(test_data)} rows")
+    
     # Run evaluation with multiple evaluators
     print(f"\n🔍 Running evaluators...")
     print("   This may take a few minutes...\n")
     
-    results = evaluate(
-        evaluation_name=f"quality-evaluation-{time.strftime('%Y%m%d-%H%M%S')}",
-        data=str(EVAL_INPUT_PATH),
-        evaluators={
-            # Operational metrics
-            "operational_metrics": OperationalMetricsEvaluator(),
-            
-            # Quality evaluators (model-based, work in all regions)
-            "tool_call_accuracy": ToolCallAccuracyEvaluator(model_config=model_config),
-            "intent_resolution": IntentResolutionEvaluator(model_config=model_config),
-            "task_adherence": TaskAdherenceEvaluator(model_config=model_config),
-            
-            # Additional quality evaluators
-            "groundedness": GroundednessEvaluator(model_config=model_config),
-            "relevance": RelevanceEvaluator(model_config=model_config),
-            "coherence": CoherenceEvaluator(model_config=model_config),
-            "fluency": FluencyEvaluator(model_config=model_config),
-            
-            # Similarity evaluator (compares with ground truth if provided)
-            "similarity": SimilarityEvaluator(model_config=model_config),
-        },
-        evaluator_config={
-            # All evaluators use conversation format
-            "tool_call_accuracy": {"column_mapping": {"conversation": "${data.conversation}"}},
-            "intent_resolution": {"column_mapping": {"conversation": "${data.conversation}"}},
-            "task_adherence": {"column_mapping": {"conversation": "${data.conversation}"}},
-            "groundedness": {"column_mapping": {"conversation": "${data.conversation}"}},
-            "relevance": {"column_mapping": {"conversation": "${data.conversation}"}},
-            "coherence": {"column_mapping": {"conversation": "${data.conversation}"}},
-            "fluency": {"column_mapping": {"conversation": "${data.conversation}"}},
-            "similarity": {
-                "column_mapping": {
-                    "conversation": "${data.conversation}",
-                    "ground_truth": "${data.ground_truth}"
-                }
-            }
-        },
-        output_path=str(EVAL_OUTPUT_PATH),
-        azure_ai_project=AZURE_AI_PROJECT_ENDPOINT,  # Upload results to AI Foundry Portal
-    )
+    # evaluate() runs rows through the promptflow batch engine, whose
+    # parallelism is set by PF_WORKER_COUNT (default 4); keep any explicit value
+    os.environ.setdefault("PF_WORKER_COUNT", str(EVAL_MAX_WORKERS))
+    
+    evaluation_name = f"quality-evaluation-{time.strftime('%Y%m%d-%H%M%S')}"
+    evaluate_kwargs = {
+        "evaluators": get_evaluators(tuple(sorted(model_config.items()))),
+        "evaluator_config": EVALUATOR_COLUMN_MAPPING,
+        "azure_ai_project": AZURE_AI_PROJECT_ENDPOINT,  # Upload results to AI Foundry Portal
+    }
+    
+    if len(test_data) > EVAL_CHUNK_SIZE:
+        # Large inputs run in checkpointed shards so a failure doesn't lose
+        # the judge calls already made
+        results = evaluate_in_shards(evaluation_name, model_config, **evaluate_kwargs)
+    else:
+        results = evaluate(
+            evaluation_name=evaluation_name,
+            data=str(EVAL_INPUT_PATH),
+            output_path=str(EVAL_OUTPUT_PATH),
+            **evaluate_kwargs
+        )
     
     # Print formatted results
     print_eval_results(results, EVAL_INPUT_PATH, EVAL_OUTPUT_PATH)
@@ -338,9 +815,14 @@ def print_eval_results(results, input_path, output_path):
     print(f"   Evaluation input:  {input_path}")
     print(f"   Evaluation output: {output_path}")
     
-    if results.get("studio_url"):
+    # Sharded runs upload one portal run per shard
+    studio_urls = results.get("studio_urls") or [results.get("studio_url")]
+    studio_urls = [url for url in studio_urls if url]
+    
+    if studio_urls:
         print(f"\n🌐 VIEW IN AI FOUNDRY PORTAL:")
-        print(f"   {results['studio_url']}")
+        for url in studio_urls:
+            print(f"   {url}")
         print("\n   👉 Click the link above to see:")
         print("      • Interactive dashboards")
         print("      • Detailed metrics breakdown")
@@ -355,11 +837,16 @@ def print_eval_results(results, input_path, output_path):
 if __name__ == "__main__":
     try:
         results = run_evaluation()
-        
-        print("\n✅ Evaluation completed successfully!")
-        print("="*80 + "\n")
-        
     except Exception as e:
         print(f"\n❌ Error during evaluation: {str(e)}")
         import traceback
         traceback.print_exc()
+        sys.exit(1)
+    
+    # run_evaluation() reports its own errors and returns None on failure
+    if results is None:
+        print("\n❌ Evaluation failed")
+        sys.exit(1)
+    
+    print("\n✅ Evaluation completed successfully!")
+    print("="*80 + "\n")